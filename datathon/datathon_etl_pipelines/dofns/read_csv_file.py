@@ -0,0 +1,90 @@
+"""An Apache Beam DoFn for parsing the rows of a CSV file."""
+import codecs
+import csv
+import io
+import itertools
+import sys
+
+import apache_beam as beam
+from datathon_etl_pipelines.utils import GzipFile
+import tensorflow as tf
+
+# The size of the blocks that are decompressed and buffered at a time.
+READ_BUFFER_SIZE = 128 * 1024
+
+# The default number of rows passed to `rows_to_elements` at a time.
+DEFAULT_BATCH_SIZE = 4096
+
+
+def open_csv_stream(gf, path):
+  """Wrap an open binary file so that it can be consumed by csv.reader.
+
+  Args:
+    gf: A binary file object, e.g. a tf.io.gfile.GFile opened in 'rb' mode.
+    path (str): The path that `gf` was opened from. Files ending in .gz are
+      decompressed in blocks of READ_BUFFER_SIZE bytes.
+
+  Returns:
+    An iterable over the lines of the decompressed file.
+  """
+  if path.endswith('.gz'):
+    stream = io.BufferedReader(
+        GzipFile(fileobj=gf, mode='rb'), buffer_size=READ_BUFFER_SIZE)
+  else:
+    stream = gf
+  if sys.version_info[0] >= 3:
+    # csv.reader consumes str in python 3, and bytes in python 2.
+    return codecs.iterdecode(stream, 'utf-8')
+  return stream
+
+
+class ReadCsvFile(beam.DoFn):
+  """Parse every row of an (optionally gzip'd) CSV file.
+
+  The file is decompressed in large blocks and parsed by a single csv.reader,
+  rather than constructing a reader for each line as would be required after
+  beam.io.ReadFromText. Gzip'd files cannot be split across workers, so this
+  does not reduce parallelism.
+
+  Args:
+    skip_header_lines (int, default=0): The number of lines to skip at the
+      beginning of the file.
+    batch_size (int, default=DEFAULT_BATCH_SIZE): The maximum number of rows
+      passed to `rows_to_elements` at a time.
+  """
+
+  def __init__(self, skip_header_lines=0, batch_size=DEFAULT_BATCH_SIZE):
+    super(ReadCsvFile, self).__init__()
+    self.skip_header_lines = skip_header_lines
+    self.batch_size = batch_size
+
+  def process(self, path, row_to_element=lambda x: x, rows_to_elements=None):
+    """Overrides beam.DoFn.process.
+
+    Args:
+      path: The full path to the CSV file. This can be a GCS URI or a local
+        path.
+      row_to_element: A function that maps each parsed row (a list of strings)
+        to the yielded element.
+      rows_to_elements: If provided, this is used instead of `row_to_element`.
+        A function that maps a list of up to `batch_size` parsed rows to an
+        iterable of elements to yield. This allows a column to be parsed for
+        many rows at once.
+
+    Yields:
+      Any: the values generated by `row_to_element` or `rows_to_elements`.
+    """
+    with tf.io.gfile.GFile(path, 'rb') as gf:
+      reader = csv.reader(open_csv_stream(gf, path))
+      for _ in range(self.skip_header_lines):
+        next(reader, None)
+      if rows_to_elements is None:
+        for row in reader:
+          yield row_to_element(row)
+      else:
+        while True:
+          rows = list(itertools.islice(reader, self.batch_size))
+          if not rows:
+            break
+          for element in rows_to_elements(rows):
+            yield element
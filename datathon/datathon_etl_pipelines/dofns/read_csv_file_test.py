@@ -0,0 +1,46 @@
+import gzip
+import os
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from datathon_etl_pipelines.dofns.read_csv_file import ReadCsvFile
+
+_CSV_CONTENTS = b'path,view,label\na/b.jpg,frontal,1.0\n"c,d.jpg",lateral,\n'
+
+
+class ReadCsvFileTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(('uncompressed', 'labels.csv', open),
+                                  ('gzip', 'labels.csv.gz', gzip.open))
+  def test_rows(self, file_name, open_fn):
+    path = os.path.join(absltest.get_default_test_tmpdir(), file_name)
+    with open_fn(path, 'wb') as f:
+      f.write(_CSV_CONTENTS)
+
+    dofn = ReadCsvFile(skip_header_lines=1)
+    rows = list(dofn.process(path))
+    self.assertEqual(rows, [['a/b.jpg', 'frontal', '1.0'],
+                            ['c,d.jpg', 'lateral', '']])
+
+  def test_row_to_element(self):
+    path = os.path.join(absltest.get_default_test_tmpdir(), 'keyed.csv')
+    with open(path, 'wb') as f:
+      f.write(_CSV_CONTENTS)
+
+    dofn = ReadCsvFile()
+    keys = list(dofn.process(path, lambda row: row[0]))
+    self.assertEqual(keys, ['path', 'a/b.jpg', 'c,d.jpg'])
+
+  def test_rows_to_elements(self):
+    path = os.path.join(absltest.get_default_test_tmpdir(), 'batched.csv')
+    with open(path, 'wb') as f:
+      f.write(_CSV_CONTENTS)
+
+    dofn = ReadCsvFile(batch_size=2)
+    batch_sizes = list(
+        dofn.process(path, rows_to_elements=lambda rows: [len(rows)]))
+    self.assertEqual(batch_sizes, [2, 1])
+
+
+if __name__ == '__main__':
+  absltest.main()
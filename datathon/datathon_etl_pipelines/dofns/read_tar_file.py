@@ -4,9 +4,16 @@ import tarfile
 import apache_beam as beam
 import tensorflow as tf
 
+# The size of the blocks that are read from the tar file at a time.
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+
 
 class ReadTarFile(beam.DoFn):
-  """Untar a tar file."""
+  """Untar a (optionally compressed) tar file.
+
+  The tar file is read as a stream in large blocks, rather than seeking to each
+  member, which amortizes the latency of reads from GCS.
+  """
 
   def process(self, path, path_to_key=lambda x: x):
     """Overrides beam.DoFn.process.
@@ -21,8 +28,8 @@ class ReadTarFile(beam.DoFn):
       Tuple[Any, bytes]: the key generated by `path_to_key` and the file
       contents.
     """
-    with tf.io.gfile.GFile(path) as gf:
-      tar = tarfile.open(fileobj=gf, mode='r')
+    with tf.io.gfile.GFile(path, 'rb') as gf:
+      tar = tarfile.open(fileobj=gf, mode='r|*', bufsize=READ_BUFFER_SIZE)
       for tar_info in tar:
         name = tar_info.name
         file_obj = tar.extractfile(tar_info)
@@ -0,0 +1,35 @@
+import io
+import os
+import tarfile
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from datathon_etl_pipelines.dofns.read_tar_file import ReadTarFile
+
+_FILES = [('train/p1/s01/view1_frontal.jpg', b'frontal'),
+          ('train/p1/s01/view2_lateral.jpg', b''),
+          ('valid/p2/s01/view1_frontal.jpg', b'x' * 100000)]
+
+
+class ReadTarFileTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(('uncompressed', 'w'), ('gzip', 'w:gz'))
+  def test_files(self, mode):
+    path = os.path.join(absltest.get_default_test_tmpdir(), mode + '.tar')
+    tar = tarfile.open(path, mode)
+    directory = tarfile.TarInfo('train')
+    directory.type = tarfile.DIRTYPE
+    tar.addfile(directory)
+    for name, contents in _FILES:
+      tar_info = tarfile.TarInfo(name)
+      tar_info.size = len(contents)
+      tar.addfile(tar_info, io.BytesIO(contents))
+    tar.close()
+
+    files = list(ReadTarFile().process(path, lambda name: name.upper()))
+    self.assertEqual(files,
+                     [(name.upper(), contents) for name, contents in _FILES])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -1,12 +1,41 @@
 """An Apache Beam DoFn for resizing images."""
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import threading
+
 import apache_beam as beam
+from apache_beam.utils.windowed_value import WindowedValue
 import tensorflow as tf
 
+# The number of images buffered for each thread before they are resized.
+_IMAGES_PER_THREAD = 2
+
+# The default limit on the total size of the buffered encoded images.
+DEFAULT_MAX_BUFFERED_BYTES = 16 * 1024 * 1024
+
+# The thread pools shared by every ResizeImage in this process, by size.
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def _get_shared_pool(num_threads):
+  """Get the pool of `num_threads` threads shared within this process.
+
+  Apache Beam runs a separate DoFn instance for each of its work threads, so a
+  pool for each instance would multiply the number of threads.
+  """
+  with _shared_pools_lock:
+    if num_threads not in _shared_pools:
+      _shared_pools[num_threads] = ThreadPool(num_threads)
+    return _shared_pools[num_threads]
+
 
 class ResizeImage(beam.DoFn):
   """Resize an image that is represented as an encoded byte-string.
 
-  Supports PNG and JPEG images.
+  Supports PNG and JPEG images. JPEG images are downscaled by libjpeg-turbo's
+  IDCT scaling while they are decoded, whenever they are at least twice as
+  large as the output, which leaves less work for the resize.
 
   Args:
     height (int): the height to resize the images to.
@@ -15,9 +44,25 @@ class ResizeImage(beam.DoFn):
       the output image. Defaults to the same number as the input.
     image_format (Union['jpg', 'png'], default='png'): the format of input and
       output images.
+    num_threads (Optional[int], default=1): the number of threads that resize
+      images concurrently. TensorFlow releases the GIL while resizing, so these
+      run in parallel. If this is greater than one, images are buffered and
+      resized in batches, so results are only yielded once a batch fills or the
+      bundle finishes. The threads are shared by every ResizeImage in the
+      process. If None, one thread is used per CPU on the worker.
+    max_buffered_bytes (int, default=DEFAULT_MAX_BUFFERED_BYTES): when images
+      are resized in batches, a batch is also resized once the encoded images
+      buffered for it total at least this many bytes. This bounds the memory
+      held by each DoFn instance when the input images are large.
   """
 
-  def __init__(self, image_format, height, width, color_channels=None):
+  def __init__(self,
+               image_format,
+               height,
+               width,
+               color_channels=None,
+               num_threads=1,
+               max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES):
     super(ResizeImage, self).__init__()
     if image_format == 'jpeg':
       image_format = 'jpg'
@@ -30,48 +75,134 @@ class ResizeImage(beam.DoFn):
       self.image_channels = 0
     else:
       self.image_channels = color_channels
+    self.num_threads = num_threads
+    self.max_buffered_bytes = max_buffered_bytes
 
     self.initialized = False
+    self._buffer = []
+    self._buffered_bytes = 0
     # Not serializable, to be initialized on each worker
     self._input_bytes_tensor = None
     self._output_bytes_tensor = None
     self._session = None
+    self._pool = None
+    self._batch_size = None
+
+  def _decode_jpeg_scaled(self, image_bytes):
+    """Decode a JPEG at the smallest scale that is at least the output size.
+
+    Args:
+      image_bytes (tf.Tensor): A scalar string tensor of JPEG bytes.
+
+    Returns:
+      tf.Tensor: A uint8 HWC image, downscaled by a ratio of 1, 2, 4 or 8.
+    """
+    shape = tf.image.extract_jpeg_shape(image_bytes)
+    height, width = self.image_shape
+
+    def decode_fn(ratio):
+      return lambda: tf.image.decode_jpeg(
+          image_bytes, channels=self.image_channels, ratio=ratio)
+
+    branches = []
+    for ratio in (8, 4, 2):
+      # The scaled dimensions are rounded up by libjpeg-turbo.
+      fits = tf.logical_and((shape[0] + ratio - 1) // ratio >= height,
+                            (shape[1] + ratio - 1) // ratio >= width)
+      branches.append((fits, decode_fn(ratio)))
+    # The largest ratio that fits is chosen, since exclusive=False.
+    return tf.case(branches, default=decode_fn(1), exclusive=False)
 
   def initialize(self):
     """Initialize the tensorflow graph and session for this worker."""
     self._input_bytes_tensor = tf.placeholder(tf.string, [])
 
     if self.image_format == 'jpg':
-      decode_fn = tf.image.decode_jpeg
+      u8image = self._decode_jpeg_scaled(self._input_bytes_tensor)
       encode_fn = tf.image.encode_jpeg
     elif self.image_format == 'png':
-      decode_fn = tf.image.decode_png
+      u8image = tf.image.decode_png(
+          self._input_bytes_tensor, channels=self.image_channels)
       encode_fn = tf.image.encode_png
     else:
       raise ValueError('Unrecognized image format ' + self.image_format)
 
-    u8image = decode_fn(self._input_bytes_tensor, channels=self.image_channels)
     resized_u8image = tf.cast(
         tf.image.resize_images(u8image, self.image_shape), tf.uint8)
     self._output_bytes_tensor = encode_fn(resized_u8image)
 
     self._session = tf.Session()
+    num_threads = self.num_threads or multiprocessing.cpu_count()
+    if num_threads > 1:
+      self._pool = _get_shared_pool(num_threads)
+      self._batch_size = _IMAGES_PER_THREAD * num_threads
     self.initialized = True
 
-  def process(self, element):
+  def resize(self, image_bytes):
+    return self._session.run(self._output_bytes_tensor,
+                             {self._input_bytes_tensor: image_bytes})
+
+  def flush(self):
+    """Resize the buffered images concurrently.
+
+    Yields:
+      WindowedValue: the key and resized image bytes of each buffered element,
+      in the window and with the timestamp of that element.
+    """
+    buffered, self._buffer = self._buffer, []
+    self._buffered_bytes = 0
+    resized = self._pool.map(self.resize,
+                             [element[1] for element, _, _ in buffered])
+    for ((key, _), timestamp, window), image_bytes in zip(buffered, resized):
+      yield WindowedValue((key, image_bytes), timestamp, [window])
+
+  def start_bundle(self):
+    """Overrides beam.DoFn.start_bundle."""
+    # Discard any elements buffered by a previous bundle that failed.
+    self._buffer = []
+    self._buffered_bytes = 0
+
+  def process(self,
+              element,
+              timestamp=beam.DoFn.TimestampParam,
+              window=beam.DoFn.WindowParam):
     """Overrides beam.DoFn.process.
 
     Args:
       element (Tuple[Any, bytes]): A key with image bytes. The key is not
         modified.
+      timestamp: The timestamp of the element, provided by Apache Beam.
+      window: The window of the element, provided by Apache Beam.
 
     Yields:
-      np.array: a HWC array of the resized image.
+      Tuple[Any, bytes]: the key with the resized image bytes.
     """
     key, image_bytes = element
     if not self.initialized:
       # Initialize non-serializable data once on each worker
       self.initialize()
-    image_bytes = self._session.run(self._output_bytes_tensor,
-                                    {self._input_bytes_tensor: image_bytes})
-    yield key, image_bytes
+    if self._pool is None:
+      yield key, self.resize(image_bytes)
+    else:
+      self._buffer.append((element, timestamp, window))
+      self._buffered_bytes += len(image_bytes)
+      if (len(self._buffer) >= self._batch_size or
+          self._buffered_bytes >= self.max_buffered_bytes):
+        for windowed_value in self.flush():
+          yield windowed_value
+
+  def finish_bundle(self):
+    """Overrides beam.DoFn.finish_bundle."""
+    if self._buffer:
+      for windowed_value in self.flush():
+        yield windowed_value
+
+  def teardown(self):
+    """Overrides beam.DoFn.teardown."""
+    # The pool is shared with the other instances in the process, so it is left
+    # open.
+    self._pool = None
+    if self._session is not None:
+      self._session.close()
+      self._session = None
+    self.initialized = False
@@ -2,6 +2,7 @@ import os
 
 from absl.testing import absltest
 from absl.testing import parameterized
+from apache_beam.transforms.window import GlobalWindow
 from datathon_etl_pipelines.dofns.resize_image import ResizeImage
 from datathon_etl_pipelines.utils import get_test_data
 import tensorflow as tf
@@ -11,7 +12,8 @@ class ResizeColorImageTest(parameterized.TestCase):
 
   @parameterized.named_parameters(('jpg', 'jpg', (320, 320, 3)),
                                   ('png', 'png', (233, 233, 3)),
-                                  ('jpg_bw', 'jpg', (61, 61, 1)))
+                                  ('jpg_bw', 'jpg', (61, 61, 1)),
+                                  ('jpg_dct_scaled', 'jpg', (200, 100, 3)))
   def test_mandrill(self, image_format, image_shape):
     dofn = ResizeImage(image_format, *image_shape)
     image_path = '{}.{}'.format(
@@ -25,6 +27,52 @@ class ResizeColorImageTest(parameterized.TestCase):
       resized_image = session.run([resized_image_tensor])
     self.assertEqual(resized_image.shape, image_shape)
 
+  def test_threaded_batches(self):
+    dofn = ResizeImage('jpg', 64, 64, num_threads=2)
+    image_path = os.path.join(get_test_data(), 'mandrill.jpg')
+    with open(image_path, 'rb') as f:
+      image_bytes = f.read()
+    outputs = []
+    for key in range(5):
+      outputs.extend(dofn.process((key, image_bytes), 0, GlobalWindow()))
+    # 2 threads buffer 4 images before the first batch is resized.
+    self.assertLen(outputs, 4)
+    outputs.extend(dofn.finish_bundle())
+    self.assertEqual([wv.value[0] for wv in outputs], list(range(5)))
+
+  def test_shared_pool(self):
+    dofns = [ResizeImage('jpg', 64, 64, num_threads=2) for _ in range(2)]
+    for dofn in dofns:
+      dofn.initialize()
+    self.assertIs(dofns[0]._pool, dofns[1]._pool)
+
+  def test_max_buffered_bytes(self):
+    image_path = os.path.join(get_test_data(), 'mandrill.jpg')
+    with open(image_path, 'rb') as f:
+      image_bytes = f.read()
+    dofn = ResizeImage(
+        'jpg', 64, 64, num_threads=2, max_buffered_bytes=len(image_bytes))
+    outputs = []
+    for key in range(3):
+      outputs.extend(dofn.process((key, image_bytes), 0, GlobalWindow()))
+    # A batch is resized after every image, rather than every 4.
+    self.assertLen(outputs, 3)
+
+  def test_start_bundle_discards_buffer(self):
+    dofn = ResizeImage('jpg', 64, 64, num_threads=2)
+    image_path = os.path.join(get_test_data(), 'mandrill.jpg')
+    with open(image_path, 'rb') as f:
+      image_bytes = f.read()
+    dofn.start_bundle()
+    self.assertEmpty(list(dofn.process((0, image_bytes), 0, GlobalWindow())))
+    # If a bundle fails before finish_bundle, Beam retries its elements, so
+    # the buffered element must not be output by the next bundle.
+    dofn.start_bundle()
+    outputs = list(dofn.process((1, image_bytes), 0, GlobalWindow()))
+    outputs.extend(dofn.finish_bundle())
+    self.assertEqual([wv.value[0] for wv in outputs], [1])
+    dofn.teardown()
+
 
 if __name__ == '__main__':
   absltest.main()
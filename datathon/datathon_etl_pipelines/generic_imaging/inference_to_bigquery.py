@@ -10,6 +10,7 @@ import tempfile
 import apache_beam as beam
 from apache_beam.io.gcp.bigquery import BigQueryDisposition
 from apache_beam.io.gcp.bigquery import WriteToBigQuery
+from apache_beam.io.gcp.bigquery_tools import FileFormat
 from apache_beam.io.tfrecordio import ReadFromTFRecord
 from apache_beam.options.pipeline_options import PipelineOptions
 from apache_beam.options.pipeline_options import SetupOptions
@@ -176,10 +177,14 @@ def build_and_run_pipeline(pipeline_options, tfrecord_pattern, predict_dofn,
         | ReadFromTFRecord(
             tfrecord_pattern, coder=beam.coders.ProtoCoder(tf.train.Example))
         | beam.ParDo(predict_dofn)
+        # Load the rows from batched Avro files with load jobs, rather than
+        # streaming inserts of JSON rows.
         | WriteToBigQuery(
             table=output_bq_table,
             schema=bq_table_schema,
-            write_disposition=BigQueryDisposition.WRITE_TRUNCATE))
+            write_disposition=BigQueryDisposition.WRITE_TRUNCATE,
+            method=WriteToBigQuery.Method.FILE_LOADS,
+            temp_file_format=FileFormat.AVRO))
 
 
 def get_commandline_args(description):
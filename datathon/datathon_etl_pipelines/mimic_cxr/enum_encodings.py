@@ -1,6 +1,5 @@
 """Enum encodings for the types and values in the MIMIC CXR dataset."""
 import re
-from typing import Dict, Union
 
 
 class SerializableEnum(object):
@@ -22,6 +21,9 @@ class SerializableEnum(object):
     for v in self.values:
       yield v
 
+  def __contains__(self, name):
+    return name in self.index_dict
+
   def __len__(self):
     return len(self.values)
 
@@ -63,6 +65,22 @@ DATASET_VALUES = SerializableEnum([
 
 ID_NAMES = SerializableEnum(['patient', 'study', 'image', 'view', 'dataset'])
 
+# Matches the relative path to a JPG image, capturing the dataset, patient_id,
+# study_id, image_id and view.
+PATH_REGEX = (r'(train|valid)/p([0-9]+)/s([0-9]+)/view([0-9]+)'
+              r'_(frontal|lateral|other)\.jpg')
+
+# Matches every line of a newline-joined list of paths that is a whole path.
+_PATHS_PATTERN = re.compile('^' + PATH_REGEX + '$', re.MULTILINE)
+
+
+def _is_number(s):
+  """Whether `s` is a non-empty string of ASCII digits, i.e. matches [0-9]+.
+
+  Unlike str.isdigit, this does not accept non-ASCII digits.
+  """
+  return bool(s) and not s.strip('0123456789')
+
 
 def path_to_ids(path):
   """Parse the path to an image in the dataset.
@@ -74,23 +92,51 @@ def path_to_ids(path):
     Tuple[int, int, int, int, int]: the patient_id, study_id, image_id, view,
     and dataset for this image.
   """
-  match = re.match(
-      r'(train|valid)/p([0-9]+)/s([0-9]+)/view([0-9]+)'
-      r'_(frontal|lateral|other)\.jpg', path)
-  if match is not None:
-    d, pid, sid, iid, v = match.groups()
-    patient_id = int(pid)
-    study_id = int(sid)
-    image_id = int(iid)
-    view = VIEW_VALUES[v]
-    dataset = DATASET_VALUES[d]
-    return patient_id, study_id, image_id, view, dataset
+  # Equivalent to matching PATH_REGEX, but splitting is much cheaper.
+  parts = path.split('/')
+  if len(parts) == 4:
+    d, pid, sid, image_name = parts
+    if (pid.startswith('p') and sid.startswith('s') and
+        image_name.startswith('view') and image_name.endswith('.jpg')):
+      iid, _, v = image_name[len('view'):-len('.jpg')].partition('_')
+      if (d in DATASET_VALUES and v in VIEW_VALUES and _is_number(pid[1:]) and
+          _is_number(sid[1:]) and _is_number(iid)):
+        patient_id = int(pid[1:])
+        study_id = int(sid[1:])
+        image_id = int(iid)
+        view = VIEW_VALUES[v]
+        dataset = DATASET_VALUES[d]
+        return patient_id, study_id, image_id, view, dataset
   raise ValueError('unrecognized path: {}'.format(path))
 
 
+def paths_to_ids(paths):
+  """Parse the paths to many images in the dataset at once.
+
+  Equivalent to [path_to_ids(path) for path in paths], but the paths are
+  parsed by a single regex scan over all of them, rather than one per path.
+
+  Args:
+    paths (List[str]): Relative paths to JPG images.
+
+  Returns:
+    List[Tuple[int, int, int, int, int]]: the patient_id, study_id, image_id,
+    view, and dataset for each image, in the same order as `paths`.
+  """
+  joined_paths = '\n'.join(paths)
+  matches = _PATHS_PATTERN.findall(joined_paths)
+  # The matches only line up with the paths if every path matches and none of
+  # them contain a newline, which could otherwise hold several matches.
+  if (len(matches) != len(paths) or
+      joined_paths.count('\n') != len(paths) - 1):
+    for path in paths:
+      if '\n' in path or not _PATHS_PATTERN.match(path):
+        raise ValueError('unrecognized path: {}'.format(path))
+  return [(int(pid), int(sid), int(iid), VIEW_VALUES[v], DATASET_VALUES[d])
+          for d, pid, sid, iid, v in matches]
+
+
 def ids_to_path(ids):
-  id_dict = dict(zip(ID_NAMES, ids))  # type: Dict[str, Union[int, str]]
-  id_dict['view'] = VIEW_VALUES(id_dict['view'])
-  id_dict['dataset'] = DATASET_VALUES(id_dict['dataset'])
-  return '{dataset}/p{patient}/s{study:02d}/view{image}_{view}.jpg'.format(
-      **id_dict)
+  patient, study, image, view, dataset = ids
+  return '{}/p{}/s{:02d}/view{}_{}.jpg'.format(
+      DATASET_VALUES(dataset), patient, study, image, VIEW_VALUES(view))
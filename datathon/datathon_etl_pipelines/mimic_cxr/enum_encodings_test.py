@@ -0,0 +1,67 @@
+import re
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import ids_to_path
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import PATH_REGEX
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import path_to_ids
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import paths_to_ids
+
+
+class PathToIdsTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('train_frontal', 'train/p12/s01/view1_frontal.jpg', (12, 1, 1, 0, 0)),
+      ('valid_lateral', 'valid/p3/s10/view2_lateral.jpg', (3, 10, 2, 1, 1)),
+      ('other', 'train/p400/s02/view13_other.jpg', (400, 2, 13, 2, 0)))
+  def test_valid_paths(self, path, true_ids):
+    self.assertTrue(re.match(PATH_REGEX, path))
+    self.assertEqual(path_to_ids(path), true_ids)
+    self.assertEqual(ids_to_path(true_ids), path)
+
+  @parameterized.named_parameters(
+      ('empty', ''), ('bad_dataset', 'test/p1/s01/view1_frontal.jpg'),
+      ('bad_view', 'train/p1/s01/view1_oblique.jpg'),
+      ('no_patient_id', 'train/p/s01/view1_frontal.jpg'),
+      ('non_ascii_digit', u'train/p\u0661/s01/view1_frontal.jpg'),
+      ('no_view', 'train/p1/s01/view1.jpg'),
+      ('png', 'train/p1/s01/view1_frontal.png'),
+      ('nested', 'files/train/p1/s01/view1_frontal.jpg'))
+  def test_invalid_paths(self, path):
+    self.assertIsNone(re.match(PATH_REGEX + '$', path))
+    with self.assertRaises(ValueError):
+      _ = path_to_ids(path)
+    with self.assertRaises(ValueError):
+      _ = paths_to_ids(['train/p1/s01/view1_frontal.jpg', path])
+
+  def test_paths_to_ids(self):
+    paths = [
+        'train/p12/s01/view1_frontal.jpg', 'valid/p3/s10/view2_lateral.jpg',
+        'train/p400/s02/view13_other.jpg'
+    ]
+    self.assertEqual(paths_to_ids(paths), [path_to_ids(p) for p in paths])
+    self.assertEqual(paths_to_ids([]), [])
+
+  def test_paths_to_ids_rejects_newlines(self):
+    # The first path holds two valid paths, which would otherwise make up for
+    # the invalid second path.
+    paths = [
+        'train/p1/s01/view1_frontal.jpg\ntrain/p2/s02/view1_lateral.jpg',
+        'garbage'
+    ]
+    with self.assertRaises(ValueError) as context:
+      _ = paths_to_ids(paths)
+    self.assertEqual(
+        str(context.exception), 'unrecognized path: {}'.format(paths[0]))
+    with self.assertRaises(ValueError):
+      _ = paths_to_ids(['train/p1/s01/view1_frontal.jpg\n'])
+
+  def test_paths_to_ids_names_invalid_path(self):
+    paths = ['train/p1/s01/view1_frontal.jpg', 'garbage']
+    with self.assertRaises(ValueError) as context:
+      _ = paths_to_ids(paths)
+    self.assertEqual(str(context.exception), 'unrecognized path: garbage')
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,140 @@
+"""Functions and DoFns that run on the workers of the MIMIC CXR pipeline.
+
+These are kept out of prepare_mimic_cxr.py, so that the workers can import
+them from this package, instead of unpickling the launcher's main session.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import apache_beam as beam
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import ID_NAMES
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import ids_to_path
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import LABEL_NAMES
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import LABEL_VALUES
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import paths_to_ids
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import VIEW_VALUES
+from datathon_etl_pipelines.mimic_cxr.mimic_cxr_tfrecord_schema import build_features
+from datathon_etl_pipelines.mimic_cxr.mimic_cxr_tfrecord_schema import fill_features
+import tensorflow as tf
+
+
+# Maps CheXpert codes onto the integers in LABEL_VALUES.
+CHEXPERT_CODE_TO_LABEL = {
+    '': LABEL_VALUES['not_mentioned'],
+    '1.0': LABEL_VALUES['positive'],
+    '-1.0': LABEL_VALUES['uncertain'],
+    '0.0': LABEL_VALUES['negative']
+}
+
+
+def chexpert_codes_to_labels(codes):
+  """Convert CheXpert codes into integers mapped by LABEL_VALUES.
+
+  Args:
+    codes (List[str]): the CheXpert codes from a row of the CSV.
+
+  Returns:
+    List[int]: the labels, in the same order as `codes`.
+  """
+  try:
+    # map avoids a python-level function call for each of the codes.
+    return list(map(CHEXPERT_CODE_TO_LABEL.__getitem__, codes))
+  except KeyError as e:
+    raise ValueError('unrecognized chexpert encoding: {}'.format(e.args[0]))
+
+
+def parse_csv_rows(rows):
+  ids = paths_to_ids([row[0] for row in rows])
+  # row[1] is the view, which is already captured within the ids
+  return [(i, chexpert_codes_to_labels(row[2:])) for i, row in zip(ids, rows)]
+
+
+def is_labelled_view(element):
+  """Whether an (ids, jpg_bytes) element belongs in the TFRecords.
+
+  Images with the 'other' view are excluded from the TFRecords.
+  """
+  return element[0][ID_NAMES['view']] != VIEW_VALUES['other']
+
+
+class WriteJpg(beam.DoFn):
+  """Write JPG images to the paths given by their ids.
+
+  Each directory is created once per worker, rather than once per image, since
+  creating a GCS directory costs an RPC.
+
+  Args:
+    output_dir (str): The directory to write the images to, ending in '/'.
+  """
+
+  def __init__(self, output_dir):
+    super(WriteJpg, self).__init__()
+    self.output_dir = output_dir
+    self._created_dirs = set()
+
+  def process(self, element):
+    """Overrides beam.DoFn.process.
+
+    Args:
+      element (Tuple[Tuple, bytes]): The set of ids for the image along with
+        the image's JPG bytes.
+    """
+    ids, jpg_bytes = element
+    file_path = self.output_dir + ids_to_path(ids)
+    dir_path = file_path.rsplit('/', 1)[0]
+    if dir_path not in self._created_dirs:
+      tf.io.gfile.makedirs(dir_path)
+      self._created_dirs.add(dir_path)
+    with tf.io.gfile.GFile(file_path, 'wb') as gf:
+      gf.write(jpg_bytes)
+
+
+class ToTFExample(beam.DoFn):
+  """Convert images joined with labels into serialized tf.train.Examples.
+
+  A single tf.train.Example is filled in and serialized for every image, which
+  avoids constructing the example's features for each image.
+  """
+
+  def __init__(self):
+    super(ToTFExample, self).__init__()
+    self.initialized = False
+    # Not serializable, to be initialized on each worker
+    self._example = None
+
+  def initialize(self):
+    """Initialize the tf.train.Example to fill in on this worker."""
+    features = build_features(
+        jpg_bytes=b'', ids=[0] * len(ID_NAMES), labels=[0] * len(LABEL_NAMES))
+    self._example = tf.train.Example(
+        features=tf.train.Features(feature=features))
+    self.initialized = True
+
+  def process(self, element, labels_by_ids):
+    """Overrides beam.DoFn.process.
+
+    Args:
+      element (Tuple[Tuple, bytes]): The set of ids for the image along with the
+        image's JPG bytes.
+      labels_by_ids (Dict[Tuple, List[int]]): The labels of every image, keyed
+        by the set of ids for the image.
+
+    Yields:
+      Tuple[str, bytes]: The name of the image's view, with the serialized
+      tf.train.Example of the labelled image. Nothing is yielded for images
+      with the 'other' view.
+    """
+    if not is_labelled_view(element):
+      return
+    ids, jpg_bytes = element
+    labels = labels_by_ids.get(ids)
+    if labels is None:
+      raise ValueError('no labels found for {}'.format(ids_to_path(ids)))
+
+    if not self.initialized:
+      # Initialize non-serializable data once on each worker
+      self.initialize()
+    fill_features(
+        self._example.features, jpg_bytes=jpg_bytes, ids=ids, labels=labels)
+    yield VIEW_VALUES(ids[ID_NAMES['view']]), self._example.SerializeToString()
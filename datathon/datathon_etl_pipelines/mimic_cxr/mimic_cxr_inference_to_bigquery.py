@@ -8,8 +8,8 @@ from datathon_etl_pipelines.generic_imaging.inference_to_bigquery import Example
 from datathon_etl_pipelines.generic_imaging.inference_to_bigquery import get_commandline_args
 from datathon_etl_pipelines.generic_imaging.inference_to_bigquery import Predict
 from datathon_etl_pipelines.mimic_cxr.enum_encodings import ID_NAMES
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import ids_to_path
 from datathon_etl_pipelines.mimic_cxr.enum_encodings import LABEL_NAMES
-from datathon_etl_pipelines.mimic_cxr.prepare_mimic_cxr import ids_to_path
 
 
 def example_to_ids(example):
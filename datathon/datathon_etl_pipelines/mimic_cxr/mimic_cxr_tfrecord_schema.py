@@ -1,16 +1,24 @@
 """Defines the format of the TFRecords produces by the MIMIC CXR ingestion pipeline."""
-import itertools
 from datathon_etl_pipelines.mimic_cxr.enum_encodings import ID_NAMES
-from datathon_etl_pipelines.mimic_cxr.enum_encodings import LABEL_NAMES
 from datathon_etl_pipelines.utils import bytes_feature
 from datathon_etl_pipelines.utils import int64_feature
 import tensorflow as tf
 
-FEATURE_DESCRIPTION = {'jpg_bytes': tf.io.FixedLenFeature([], tf.string)}
-for feature_name in itertools.chain(LABEL_NAMES, ID_NAMES):
+# The labels are stored as one int8 per label, in the same order as LABEL_NAMES.
+# Decode them with tf.io.decode_raw(parsed['labels'], tf.int8).
+FEATURE_DESCRIPTION = {
+    'jpg_bytes': tf.io.FixedLenFeature([], tf.string),
+    'labels': tf.io.FixedLenFeature([], tf.string),
+}
+for feature_name in ID_NAMES:
   FEATURE_DESCRIPTION[feature_name] = tf.io.FixedLenFeature([], tf.int64)
 
 
+def encode_labels(labels):
+  """Pack label values, which are all in LABEL_VALUES, into one int8 each."""
+  return bytes(bytearray(labels))
+
+
 def build_features(jpg_bytes, ids, labels):
   """Create a dictionary of features for building a MIMIC CXR TFRecord.
 
@@ -26,11 +34,34 @@ def build_features(jpg_bytes, ids, labels):
     Dict[str, tf.train.Feature]:  A dictionary of features that can be used to
     construct a TFExample.
   """
-  features = {'jpg_bytes': bytes_feature(jpg_bytes)}
+  features = {
+      'jpg_bytes': bytes_feature(jpg_bytes),
+      'labels': bytes_feature(encode_labels(labels))
+  }
 
   for name, value in zip(ID_NAMES, ids):
     features[name] = int64_feature(value)
-  for label, value in zip(LABEL_NAMES, labels):
-    features[label] = int64_feature(value)
 
   return features
+
+
+def fill_features(features, jpg_bytes, ids, labels):
+  """Overwrite the values of features created by `build_features`.
+
+  This is cheaper than calling `build_features` for each instance, since the
+  features are modified in place rather than constructed.
+
+  Args:
+    features (tf.train.Features): Features with the values from
+      `build_features`, which are replaced.
+    jpg_bytes (bytes): The contents of the jpg image for this instance.
+    ids (Tuple[int, int, int, int, int]): A tuple of integers identifiers of the
+      form  (patient, study, image, view, dataset).
+    labels (List[int]): the values of the labels in the same order as
+      `datathon_etl_pipelines.mimic_cxr.enum_encodings.LABEL_NAMES`
+  """
+  feature = features.feature
+  feature['jpg_bytes'].bytes_list.value[0] = jpg_bytes
+  feature['labels'].bytes_list.value[0] = encode_labels(labels)
+  for name, value in zip(ID_NAMES, ids):
+    feature[name].int64_list.value[0] = value
@@ -29,9 +29,10 @@ The gzip'd CSV file contains columns:
 See https://physionet.org/works/MIMICCXR/files/ for more details and to download
 this data.
 
-This apache beam pipeline takes this set of files as input, and outputs a
-BigQuery table, two TFRecords (one for frontal and one for lateral images),
-and the untar'd jpg images. This delivers an ergonomic presentation of the
+This script takes this set of files as input, and outputs a BigQuery table
+(populated by BigQuery load and query jobs), and, using an apache beam
+pipeline, two TFRecords (one for frontal and one for lateral images) and the
+untar'd jpg images. This delivers an ergonomic presentation of the
 dataset that enables high productivity for data scientists working with this
 data at datathons.
 
@@ -43,99 +44,168 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
-import csv
 import inspect
+import json
 import os
+import uuid
 
 import apache_beam as beam
-from apache_beam.io.gcp.bigquery import BigQueryDisposition
-from apache_beam.io.gcp.bigquery import WriteToBigQuery
-from apache_beam.io.gcp.bigquery_tools import parse_table_schema_from_json
+from apache_beam.io import fileio
+from apache_beam.io.filesystem import CompressionTypes
+from apache_beam.io.gcp.bigquery_tools import parse_table_reference
+from apache_beam.options.pipeline_options import GoogleCloudOptions
 from apache_beam.options.pipeline_options import PipelineOptions
 from apache_beam.options.pipeline_options import SetupOptions
+from datathon_etl_pipelines.dofns.read_csv_file import ReadCsvFile
 from datathon_etl_pipelines.dofns.read_tar_file import ReadTarFile
 from datathon_etl_pipelines.dofns.resize_image import ResizeImage
-from datathon_etl_pipelines.mimic_cxr.enum_encodings import ID_NAMES
-from datathon_etl_pipelines.mimic_cxr.enum_encodings import ids_to_path
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import DATASET_VALUES
 from datathon_etl_pipelines.mimic_cxr.enum_encodings import LABEL_NAMES
-from datathon_etl_pipelines.mimic_cxr.enum_encodings import LABEL_VALUES
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import PATH_REGEX
 from datathon_etl_pipelines.mimic_cxr.enum_encodings import path_to_ids
 from datathon_etl_pipelines.mimic_cxr.enum_encodings import VIEW_VALUES
-from datathon_etl_pipelines.mimic_cxr.mimic_cxr_tfrecord_schema import build_features
+from datathon_etl_pipelines.mimic_cxr.mimic_cxr_fns import CHEXPERT_CODE_TO_LABEL
+from datathon_etl_pipelines.mimic_cxr.mimic_cxr_fns import is_labelled_view
+from datathon_etl_pipelines.mimic_cxr.mimic_cxr_fns import parse_csv_rows
+from datathon_etl_pipelines.mimic_cxr.mimic_cxr_fns import ToTFExample
+from datathon_etl_pipelines.mimic_cxr.mimic_cxr_fns import WriteJpg
+from datathon_etl_pipelines.sinks.tfrecord_sink import destination_of
+from datathon_etl_pipelines.sinks.tfrecord_sink import suffixed_destination_naming
+from datathon_etl_pipelines.sinks.tfrecord_sink import tfrecord_sink_fn
 from datathon_etl_pipelines.utils import get_setup_file
+from google.cloud import bigquery
 import tensorflow as tf
 
 
-class ChexpertConverter(object):
-  """Converts CheXpert codes into integers mapped by LABEL_VALUES."""
-  chexpert_code_to_index = {
-      '': LABEL_VALUES['not_mentioned'],
-      '1.0': LABEL_VALUES['positive'],
-      '-1.0': LABEL_VALUES['uncertain'],
-      '0.0': LABEL_VALUES['negative']
-  }
-
-  @classmethod
-  def convert(cls, s):
-    int_code = cls.chexpert_code_to_index.get(s, None)
-    if int_code is None:
-      raise ValueError('unrecognized chexpert encoding: {}'.format(s))
-    else:
-      return int_code
-
-
-def parse_csv_row(line):
-  row = next(csv.reader([line]))
-  ids = path_to_ids(row[0])
-  # row[1] is the view, which is already captured within the ids
-  return ids, [ChexpertConverter.convert(s) for s in row[2:]]
-
+def import_json_bq_schema():
+  path = os.path.join(
+      os.path.dirname(inspect.getfile(inspect.currentframe())),
+      'mimic_cxr_bigquery_labels_schema.json')
 
-def to_bigquery_json(ids_row):
-  ids, row = ids_row
-  bq = {col: val for col, val in zip(LABEL_NAMES, row)}
-  bq.update(**dict(zip(ID_NAMES, ids)))
-  bq['path'] = ids_to_path(ids)
-  return bq
+  with open(path) as fp:
+    return [
+        bigquery.SchemaField.from_api_repr(field)
+        for field in json.load(fp)['fields']
+    ]
 
 
-def write_jpg(element, path):
-  ids, jpg_bytes = element
-  file_path = path + ids_to_path(ids)
-  tf.io.gfile.makedirs(file_path.rsplit('/', 1)[0])
-  with tf.io.gfile.GFile(file_path, 'wb') as gf:
-    gf.write(jpg_bytes)
+def _enum_to_int_sql(expression, str_to_int, description):
+  """Build a SQL expression that maps strings to integers, or fails."""
+  cases = ' '.join("WHEN '{}' THEN {}".format(name, value)
+                   for name, value in sorted(str_to_int.items()))
+  return ("CASE {expression} {cases} "
+          "ELSE ERROR(CONCAT('unrecognized {description}: ', {expression})) "
+          "END").format(
+              expression=expression, cases=cases, description=description)
 
 
-def to_tf_example(element):
-  """Construct a tf.train.Example from an image joined with labels.
+def build_labels_query(raw_table, schema):
+  """Build a query that converts the raw labels CSV into the labels table.
 
   Args:
-    element (Tuple[Tuple, Dict[Union['jpgs', 'rows'], List[List[int]]]]): The
-      set of ids for the image along with the joined image and labels.
+    raw_table (str): The fully qualified `project.dataset.table` name of the
+      table that the CSV was loaded into, with every column as a STRING.
+    schema (List[bigquery.SchemaField]): The schema of the labels table, as
+      returned by `import_json_bq_schema`.
 
   Returns:
-    tf.train.Example: The labelled image.
+    str: A StandardSQL query that produces the columns of the labels table in
+    the order of `schema`.
   """
-  (ids, join) = element
-  if len(join['jpgs']) != 1 or len(join['rows']) != 1:
-    raise ValueError('{} JPG files matched to {} rows for {}'.format(
-        len(join['jpgs']), len(join['rows']), ids_to_path(ids)))
-
-  features = build_features(
-      jpg_bytes=join['jpgs'][0], ids=ids, labels=join['rows'][0])
-
-  example = tf.train.Example(features=tf.train.Features(feature=features))
-  return example
-
-
-def import_json_bq_schema():
-  path = os.path.join(
-      os.path.dirname(inspect.getfile(inspect.currentframe())),
-      'mimic_cxr_bigquery_labels_schema.json')
+  columns = {
+      'patient':
+          r"CAST(REGEXP_EXTRACT(path, r'/p([0-9]+)/') AS INT64)",
+      'study':
+          r"CAST(REGEXP_EXTRACT(path, r'/s([0-9]+)/') AS INT64)",
+      'image':
+          r"CAST(REGEXP_EXTRACT(path, r'/view([0-9]+)_') AS INT64)",
+      'view':
+          _enum_to_int_sql(r"REGEXP_EXTRACT(path, r'_([a-z]+)\.jpg$')",
+                           {v: VIEW_VALUES[v] for v in VIEW_VALUES}, 'view'),
+      'dataset':
+          _enum_to_int_sql(r"REGEXP_EXTRACT(path, r'^([a-z]+)/')",
+                           {d: DATASET_VALUES[d] for d in DATASET_VALUES},
+                           'dataset'),
+      'path':
+          'path',
+  }
+  for label in LABEL_NAMES:
+    # Empty CSV values are loaded as NULL.
+    columns[label] = _enum_to_int_sql("IFNULL({}, '')".format(label),
+                                      CHEXPERT_CODE_TO_LABEL,
+                                      'chexpert encoding')
+
+  select = ',\n  '.join('{} AS {}'.format(columns[field.name], field.name)
+                         for field in schema)
+  return """
+SELECT
+  {select}
+FROM (
+  SELECT
+    * REPLACE (
+      IF(REGEXP_CONTAINS(path, r'^{path_regex}$'), path,
+         ERROR(CONCAT('unrecognized path: ', path))) AS path)
+  FROM `{raw_table}`)
+""".format(select=select, path_regex=PATH_REGEX, raw_table=raw_table)
+
+
+def load_labels_to_bigquery(input_csv, output_bq_table, project=None):
+  """Populate the labels table from the CSV using BigQuery load and query jobs.
+
+  The CSV is loaded as-is into a uniquely named temporary table by a load job,
+  which is then converted into the labels table by a query. This keeps the
+  per-row parsing within BigQuery, rather than streaming every row through
+  Apache Beam. The temporary table is deleted even if either job fails.
 
-  with open(path) as fp:
-    return parse_table_schema_from_json(fp.read())
+  Args:
+    input_csv (str): The path to the (optionally gzip'd) CSV that contains the
+      image labels. Local files are uploaded.
+    output_bq_table (str): A string of the form `project:dataset.table_name`.
+      This table will be overwritten if it already exists.
+    project (Optional[str]): The project to run the BigQuery jobs in, and the
+      project of the table if `output_bq_table` does not specify one.
+  """
+  schema = import_json_bq_schema()
+  table_ref = parse_table_reference(output_bq_table, project=project)
+  client = bigquery.Client(project=project or table_ref.projectId)
+  dataset = bigquery.DatasetReference(table_ref.projectId, table_ref.datasetId)
+  output_table = dataset.table(table_ref.tableId)
+  # A unique name avoids overwriting an existing table in the dataset.
+  raw_table = dataset.table('{}_raw_csv_{}'.format(table_ref.tableId,
+                                                  uuid.uuid4().hex))
+
+  load_config = bigquery.LoadJobConfig()
+  load_config.source_format = bigquery.SourceFormat.CSV
+  load_config.skip_leading_rows = 1
+  load_config.schema = [
+      bigquery.SchemaField(name, 'STRING')
+      for name in ['path', 'view'] + list(LABEL_NAMES)
+  ]
+  load_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
+  try:
+    if input_csv.startswith('gs://'):
+      client.load_table_from_uri(
+          input_csv, raw_table, job_config=load_config).result()
+    else:
+      with tf.io.gfile.GFile(input_csv, 'rb') as fp:
+        client.load_table_from_file(
+            fp, raw_table, job_config=load_config).result()
+
+    query_config = bigquery.QueryJobConfig()
+    query_config.destination = output_table
+    query_config.write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE
+    client.query(
+        build_labels_query(
+            '{}.{}.{}'.format(raw_table.project, raw_table.dataset_id,
+                              raw_table.table_id), schema),
+        job_config=query_config).result()
+  finally:
+    client.delete_table(raw_table, not_found_ok=True)
+
+  # Query results don't carry column descriptions, so restore the schema.
+  table = client.get_table(output_table)
+  table.schema = schema
+  client.update_table(table, ['schema'])
 
 
 def build_and_run_pipeline(pipeline_options,
@@ -144,7 +214,8 @@ def build_and_run_pipeline(pipeline_options,
                            output_jpg_dir,
                            output_bq_table,
                            output_tfrecord_dir,
-                           output_image_shape=None):
+                           output_image_shape=None,
+                           compress_tfrecords=False):
   """Construct and run the Apache Beam Pipeline.
 
   Args:
@@ -159,6 +230,7 @@ def build_and_run_pipeline(pipeline_options,
     output_tfrecord_dir (str): The directory to output the sharded TFRecords to.
     output_image_shape (Optional[Tuple]): The dimensions to resize the image to.
       Either HW or HWC. If this is None, then the images will not be resized.
+    compress_tfrecords (bool): Whether to GZIP the TFRecords.
   """
   input_paths = []
   for pattern in input_tars:
@@ -167,47 +239,68 @@ def build_and_run_pipeline(pipeline_options,
   if not input_paths:
     raise ValueError('No matching tar files were found.')
 
-  with beam.Pipeline(options=pipeline_options) as p:
+  if output_bq_table is not None:
+    load_labels_to_bigquery(
+        input_csv,
+        output_bq_table,
+        project=pipeline_options.view_as(GoogleCloudOptions).project)
 
-    rows = (
-        p
-        | beam.io.ReadFromText(input_csv, skip_header_lines=1)
-        | beam.Map(parse_csv_row))
+  if output_jpg_dir is None and output_tfrecord_dir is None:
+    return
 
-    if output_bq_table is not None:
-      _ = rows | beam.Map(to_bigquery_json) | WriteToBigQuery(
-          table=output_bq_table,
-          schema=import_json_bq_schema(),
-          write_disposition=BigQueryDisposition.WRITE_TRUNCATE)
-
-    if output_jpg_dir is not None or output_tfrecord_dir is not None:
-      jpgs = p | beam.Create(input_paths) | beam.ParDo(ReadTarFile(),
-                                                       path_to_ids)
-
-      if output_image_shape is not None:
-        jpgs |= beam.ParDo(ResizeImage('jpg', *output_image_shape))
-
-      if output_jpg_dir is not None:
-        if not output_jpg_dir.endswith('/'):
-          output_jpg_dir += '/'
-        _ = jpgs | beam.Map(write_jpg, output_jpg_dir)
-
-      joined = {'jpgs': jpgs, 'rows': rows} | beam.CoGroupByKey()
-
-      frontal, lateral, _ = joined | 'Partition on view' >> beam.Partition(
-          lambda kv, n_split: kv[0][ID_NAMES['view']], len(VIEW_VALUES))
-
-      if output_tfrecord_dir is not None:
-        if not output_tfrecord_dir.endswith('/'):
-          output_tfrecord_dir += '/'
-        for pcol, name in [(frontal, 'frontal'), (lateral, 'lateral')]:
-          _ = (
-              pcol
-              | (name + '_to_tf_example') >> beam.Map(to_tf_example)
-              | (name + '_write_tf_record') >> beam.io.WriteToTFRecord(
-                  output_tfrecord_dir + name,
-                  file_name_suffix='.tfrecord',
-                  coder=beam.coders.ProtoCoder(tf.train.Example)))
+  with beam.Pipeline(options=pipeline_options) as p:
+    jpgs = p | beam.Create(input_paths) | beam.ParDo(ReadTarFile(), path_to_ids)
+
+    if output_jpg_dir is None:
+      # Images with the 'other' view are not written to the TFRecords, so drop
+      # them before they are resized.
+      jpgs |= beam.Filter(is_labelled_view)
+
+    if output_image_shape is not None:
+      # Dataflow already runs an SDK process per vCPU, each with several DoFn
+      # instances, so only a few threads are needed to overlap the resizes.
+      jpgs |= beam.ParDo(
+          ResizeImage('jpg', *output_image_shape, num_threads=2))
+
+    if output_jpg_dir is not None:
+      if not output_jpg_dir.endswith('/'):
+        output_jpg_dir += '/'
+      _ = jpgs | beam.ParDo(WriteJpg(output_jpg_dir))
+
+    if output_tfrecord_dir is not None:
+      if not output_tfrecord_dir.endswith('/'):
+        output_tfrecord_dir += '/'
+
+      rows = (
+          p
+          | 'CreateCsvPath' >> beam.Create([input_csv])
+          | beam.ParDo(
+              ReadCsvFile(skip_header_lines=1),
+              rows_to_elements=parse_csv_rows))
+
+      # The labels are small enough to broadcast to every worker, which avoids
+      # shuffling the (much larger) JPG bytes to join them with the labels.
+      labels_by_ids = beam.pvalue.AsDict(rows)
+
+      if compress_tfrecords:
+        compression_type = CompressionTypes.GZIP
+        suffix = '.tfrecord.gz'
+      else:
+        compression_type = CompressionTypes.UNCOMPRESSED
+        suffix = '.tfrecord'
+
+      # Write the frontal and lateral TFRecords with a single transform. Each
+      # destination needs its own sink, so a factory is passed rather than an
+      # instance, which would be shared between destinations. The factory is
+      # defined in tfrecord_sink, since the main session isn't pickled.
+      _ = (
+          jpgs
+          | beam.ParDo(ToTFExample(), labels_by_ids)
+          | fileio.WriteToFiles(
+              path=output_tfrecord_dir,
+              destination=destination_of,
+              sink=tfrecord_sink_fn(compression_type=compression_type),
+              file_naming=suffixed_destination_naming(suffix)))
 
 
 def main():
@@ -242,10 +335,17 @@ def main():
       required=False,
       help='The dimensions to resize the image to. Either HW or HWC. If this is'
       ' None, then the images will not be resized.')
+  parser.add_argument(
+      '--compress_tfrecords',
+      action='store_true',
+      help='GZIP the TFRecords at a fast compression level. They must then be '
+      'read with compression_type=\'GZIP\'.')
 
   args, pipeline_args = parser.parse_known_args()
   beam_options = PipelineOptions(pipeline_args)
-  beam_options.view_as(SetupOptions).save_main_session = True
+  # Everything the workers run is imported from this package, which is
+  # installed from the setup file, so the main session isn't needed.
+  beam_options.view_as(SetupOptions).save_main_session = False
   beam_options.view_as(SetupOptions).setup_file = get_setup_file()
 
   if args.output_image_shape is not None:
@@ -260,7 +360,8 @@ def main():
       output_jpg_dir=args.output_jpg_dir,
       output_bq_table=args.output_bq_table,
       output_tfrecord_dir=args.output_tfrecord_dir,
-      output_image_shape=args.output_image_shape)
+      output_image_shape=args.output_image_shape,
+      compress_tfrecords=args.compress_tfrecords)
 
 
 if __name__ == '__main__':
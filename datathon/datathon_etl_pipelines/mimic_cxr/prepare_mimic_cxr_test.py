@@ -0,0 +1,60 @@
+import re
+
+from absl.testing import absltest
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import DATASET_VALUES
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import LABEL_NAMES
+from datathon_etl_pipelines.mimic_cxr.enum_encodings import VIEW_VALUES
+from datathon_etl_pipelines.mimic_cxr.mimic_cxr_fns import CHEXPERT_CODE_TO_LABEL
+from datathon_etl_pipelines.mimic_cxr.prepare_mimic_cxr import _enum_to_int_sql
+from datathon_etl_pipelines.mimic_cxr.prepare_mimic_cxr import build_labels_query
+from datathon_etl_pipelines.mimic_cxr.prepare_mimic_cxr import import_json_bq_schema
+
+
+class EnumToIntSqlTest(absltest.TestCase):
+
+  def test_cases(self):
+    self.assertEqual(
+        _enum_to_int_sql('col', {'b': 1, 'a': 0}, 'letter'),
+        "CASE col WHEN 'a' THEN 0 WHEN 'b' THEN 1 "
+        "ELSE ERROR(CONCAT('unrecognized letter: ', col)) END")
+
+
+class BuildLabelsQueryTest(absltest.TestCase):
+
+  def setUp(self):
+    super(BuildLabelsQueryTest, self).setUp()
+    self.schema = import_json_bq_schema()
+    self.query = build_labels_query('project.dataset.raw', self.schema)
+
+  def test_column_order(self):
+    # Each selected column is on its own line, ending in `AS <name>`.
+    columns = re.findall(r' AS (\w+),?\n', self.query)
+    self.assertEqual(columns, [field.name for field in self.schema])
+
+  def test_enum_mappings(self):
+    for view in VIEW_VALUES:
+      self.assertIn("WHEN '{}' THEN {}".format(view, VIEW_VALUES[view]),
+                    self.query)
+    for dataset in DATASET_VALUES:
+      self.assertIn(
+          "WHEN '{}' THEN {}".format(dataset, DATASET_VALUES[dataset]),
+          self.query)
+    for label in LABEL_NAMES:
+      self.assertIn('CASE IFNULL({}, \'\')'.format(label), self.query)
+    for code, value in CHEXPERT_CODE_TO_LABEL.items():
+      self.assertIn("WHEN '{}' THEN {}".format(code, value), self.query)
+
+  def test_errors(self):
+    for description in ('view', 'dataset', 'path'):
+      self.assertIn("ERROR(CONCAT('unrecognized {}: '".format(description),
+                    self.query)
+    self.assertEqual(
+        self.query.count("ERROR(CONCAT('unrecognized chexpert encoding: '"),
+        len(LABEL_NAMES))
+
+  def test_raw_table(self):
+    self.assertIn('FROM `project.dataset.raw`', self.query)
+
+
+if __name__ == '__main__':
+  absltest.main()
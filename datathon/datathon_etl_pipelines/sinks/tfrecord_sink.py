@@ -0,0 +1,115 @@
+"""An Apache Beam FileSink for writing TFRecords with beam.io.fileio."""
+import struct
+
+import apache_beam as beam
+from apache_beam.io import fileio
+from apache_beam.io.filesystem import CompressionTypes
+# Beam doesn't expose TFRecord checksums outside of WriteToTFRecord.
+from apache_beam.io.tfrecordio import _TFRecordUtil
+from datathon_etl_pipelines.utils import GZIP_FASTEST_COMPRESSION_LEVEL
+from datathon_etl_pipelines.utils import GzipFile
+
+# The gzip compression level. JPG images barely compress, so favour speed.
+GZIP_COMPRESSION_LEVEL = GZIP_FASTEST_COMPRESSION_LEVEL
+
+
+def destination_of(element):
+  """Use the first item of a (destination, record) pair as the destination.
+
+  This is intended to be the `destination` of beam.io.fileio.WriteToFiles when
+  writing with TFRecordSink.
+  """
+  return element[0]
+
+
+def suffixed_destination_naming(suffix):
+  """Name each file by its destination, followed by `suffix`.
+
+  This is intended to be the `file_naming` of beam.io.fileio.WriteToFiles.
+  fileio.destination_prefix_naming only accepts a suffix from Apache Beam 2.25,
+  which no longer supports python 2.
+
+  Args:
+    suffix (str): The suffix of every file name, e.g. '.tfrecord'.
+
+  Returns:
+    Callable: A file naming function for beam.io.fileio.WriteToFiles.
+  """
+  naming = fileio.destination_prefix_naming()
+
+  def _inner(window, pane, shard_index, total_shards, compression, destination):
+    return naming(window, pane, shard_index, total_shards, compression,
+                  destination) + suffix
+
+  return _inner
+
+
+class TFRecordSink(fileio.FileSink):
+  """Write (destination, record) pairs to a TFRecord file.
+
+  Only the records are written, with the destination used by
+  beam.io.fileio.WriteToFiles to choose the file. This allows a single
+  WriteToFiles transform to write to several TFRecord datasets. Each sink writes
+  to a single file, so WriteToFiles must be given a function that creates a
+  sink for each destination, such as tfrecord_sink_fn, rather than a sink.
+
+  Args:
+    coder (beam.coders.Coder, default=BytesCoder()): Encodes each record.
+    compression_type (CompressionTypes, default=UNCOMPRESSED): Either
+      UNCOMPRESSED or GZIP. GZIP'd TFRecords must be read with
+      compression_type='GZIP'.
+  """
+
+  def __init__(self,
+               coder=beam.coders.BytesCoder(),
+               compression_type=CompressionTypes.UNCOMPRESSED):
+    if compression_type not in (CompressionTypes.UNCOMPRESSED,
+                                CompressionTypes.GZIP):
+      raise ValueError('Unsupported compression type ' + compression_type)
+    self._coder = coder
+    self.compression_type = compression_type
+    self._fh = None
+
+  def open(self, fh):
+    if self.compression_type == CompressionTypes.GZIP:
+      fh = GzipFile(
+          fileobj=fh, mode='wb', compresslevel=GZIP_COMPRESSION_LEVEL)
+    self._fh = fh
+
+  def write(self, element):
+    _, record = element
+    value = self._coder.encode(record)
+    # Unlike _TFRecordUtil.write_record, write the framing around the value
+    # rather than joining them, which would copy every (large) value.
+    encoded_length = struct.pack(b'<Q', len(value))
+    self._fh.write(encoded_length + struct.pack(
+        b'<I', _TFRecordUtil._masked_crc32c(encoded_length)))
+    self._fh.write(value)
+    self._fh.write(struct.pack(b'<I', _TFRecordUtil._masked_crc32c(value)))
+
+  def flush(self):
+    # WriteToFiles only flushes once it has written every record to the file.
+    if self.compression_type == CompressionTypes.GZIP:
+      # Write the gzip trailer. The underlying file is not closed.
+      self._fh.close()
+    else:
+      self._fh.flush()
+
+
+def tfrecord_sink_fn(coder=beam.coders.BytesCoder(),
+                     compression_type=CompressionTypes.UNCOMPRESSED):
+  """Create a TFRecordSink for each destination of WriteToFiles.
+
+  This is intended to be the `sink` of beam.io.fileio.WriteToFiles. It is
+  defined here, rather than as a lambda in the pipeline's main module, since the
+  main session isn't pickled for the workers.
+
+  Args:
+    coder (beam.coders.Coder, default=BytesCoder()): Encodes each record.
+    compression_type (CompressionTypes, default=UNCOMPRESSED): Either
+      UNCOMPRESSED or GZIP.
+
+  Returns:
+    Callable[[Any], TFRecordSink]: Creates a new sink for a destination.
+  """
+  return lambda _: TFRecordSink(coder=coder, compression_type=compression_type)
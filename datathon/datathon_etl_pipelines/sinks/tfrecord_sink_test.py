@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+from absl.testing import absltest
+from absl.testing import parameterized
+import apache_beam as beam
+from apache_beam.io import fileio
+from apache_beam.io.filesystem import CompressionTypes
+from apache_beam.testing.test_pipeline import TestPipeline
+from apache_beam.transforms.window import GlobalWindow
+from datathon_etl_pipelines.sinks.tfrecord_sink import destination_of
+from datathon_etl_pipelines.sinks.tfrecord_sink import suffixed_destination_naming
+from datathon_etl_pipelines.sinks.tfrecord_sink import tfrecord_sink_fn
+from datathon_etl_pipelines.sinks.tfrecord_sink import TFRecordSink
+import tensorflow as tf
+
+
+class TFRecordSinkTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('uncompressed', CompressionTypes.UNCOMPRESSED, None),
+      ('gzip', CompressionTypes.GZIP,
+       tf.python_io.TFRecordCompressionType.GZIP))
+  def test_readable_by_tensorflow(self, compression_type, tf_compression_type):
+    path = os.path.join(absltest.get_default_test_tmpdir(),
+                        compression_type + '.tfrecord')
+    records = [('a', b'first'), ('b', b''), ('a', b'third')]
+    sink = TFRecordSink(compression_type=compression_type)
+    with open(path, 'wb') as fh:
+      sink.open(fh)
+      for record in records:
+        sink.write(record)
+      sink.flush()
+
+    options = tf.python_io.TFRecordOptions(tf_compression_type)
+    self.assertEqual(
+        list(tf.python_io.tf_record_iterator(path, options)),
+        [value for _, value in records])
+
+  @parameterized.named_parameters(
+      ('uncompressed', CompressionTypes.UNCOMPRESSED, None, '.tfrecord'),
+      ('gzip', CompressionTypes.GZIP, tf.python_io.TFRecordCompressionType.GZIP,
+       '.tfrecord.gz'))
+  def test_write_to_files(self, compression_type, tf_compression_type, suffix):
+    output_dir = tempfile.mkdtemp(dir=absltest.get_default_test_tmpdir())
+    records = [('frontal', b'first'), ('lateral', b'second'),
+               ('frontal', b'third'), ('lateral', b'fourth')]
+    with TestPipeline() as p:
+      _ = (
+          p
+          | beam.Create(records)
+          | fileio.WriteToFiles(
+              path=output_dir,
+              destination=destination_of,
+              sink=tfrecord_sink_fn(compression_type=compression_type),
+              file_naming=suffixed_destination_naming(suffix)))
+
+    options = tf.python_io.TFRecordOptions(tf_compression_type)
+    for destination in ('frontal', 'lateral'):
+      paths = tf.io.gfile.glob(
+          os.path.join(output_dir, destination + '*' + suffix))
+      self.assertLen(paths, 1)
+      self.assertEqual(
+          sorted(tf.python_io.tf_record_iterator(paths[0], options)),
+          sorted(value for d, value in records if d == destination))
+
+  def test_destination_of(self):
+    self.assertEqual(destination_of(('frontal', b'record')), 'frontal')
+
+  def test_suffixed_destination_naming(self):
+    naming = suffixed_destination_naming('.tfrecord.gz')
+    name = naming(GlobalWindow(), None, 0, 1, '', 'frontal')
+    self.assertTrue(name.startswith('frontal'))
+    self.assertTrue(name.endswith('.tfrecord.gz'))
+
+
+if __name__ == '__main__':
+  absltest.main()
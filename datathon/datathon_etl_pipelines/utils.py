@@ -5,6 +5,16 @@ import os
 
 import tensorflow as tf
 
+try:
+  # ISA-L's deflate and inflate are several times faster than zlib's, but it is
+  # only available for python 3.
+  from isal.igzip import IGzipFile as GzipFile
+  # ISA-L's compression levels range from 0 to 3.
+  GZIP_FASTEST_COMPRESSION_LEVEL = 0
+except ImportError:
+  from gzip import GzipFile
+  GZIP_FASTEST_COMPRESSION_LEVEL = 1
+
 
 def get_setup_file():
   """Returns the absolute path to the setup file for this package.
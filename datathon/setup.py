@@ -7,6 +7,6 @@ setuptools.setup(
     version='0.1',
     install_requires=[
         'apache-beam[gcp]', 'google-cloud-storage', 'tf-nightly', 'typing',
-        'numpy'
+        'numpy', 'isal; python_version >= "3.7"'
     ],
     packages=setuptools.find_packages())